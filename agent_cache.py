@@ -0,0 +1,114 @@
+import array
+import hashlib
+import math
+import os
+import sqlite3
+
+from config import EMBEDDING_MODEL, SEMANTIC_CACHE_THRESHOLD
+
+CACHE_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".semantic_cache.sqlite3")
+
+
+class SemanticCache:
+    """Caches final responses keyed by an embedding of the prompt.
+
+    A lookup returns the stored response of the most similar earlier prompt if
+    their cosine similarity reaches the threshold. Entries are persisted in SQLite
+    and kept in memory as unit vectors, so similarity is a plain dot product.
+    Embedding and database failures are treated as cache misses, and a database
+    that can't be opened leaves the cache in memory for the current run.
+
+    Args:
+        client (genai.Client): The GenAI client used to embed prompts.
+        path (str, optional): The SQLite database file. Defaults to CACHE_DB.
+        threshold (float, optional): The minimum cosine similarity for a hit.
+            Defaults to SEMANTIC_CACHE_THRESHOLD.
+        context (str, optional): What the responses depend on besides the prompt, such
+            as the model and system prompt. Entries stored under a different context
+            are ignored. Defaults to "".
+    """
+
+    def __init__(self, client, path=CACHE_DB, threshold=SEMANTIC_CACHE_THRESHOLD, context=""):
+        self.client = client
+        self.threshold = threshold
+        self._context = hashlib.sha256(context.encode("utf-8")).hexdigest()
+        self._embeddings = {}
+        self._db = None
+        self._entries = []
+        try:
+            db = sqlite3.connect(path)
+        except sqlite3.Error:
+            return
+        try:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS cached_responses"
+                " (context TEXT, prompt TEXT, embedding BLOB, response TEXT)"
+            )
+            self._entries = [
+                (array.array("d", embedding), response)
+                for embedding, response in db.execute(
+                    "SELECT embedding, response FROM cached_responses WHERE context = ?",
+                    (self._context,),
+                )
+            ]
+        except sqlite3.Error:
+            # A damaged or read-only file, keep the cache in memory instead
+            db.close()
+            return
+        self._db = db
+
+    async def lookup(self, prompt):
+        """Returns the cached response for the most similar prompt.
+
+        Args:
+            prompt (str): The user prompt.
+
+        Returns:
+            str: The cached response, or None on a miss.
+        """
+        embedding = await self._embed(prompt)
+        if embedding is None:
+            return None
+        best_score, best_response = self.threshold, None
+        for cached, response in self._entries:
+            score = sum(a * b for a, b in zip(embedding, cached))
+            if score >= best_score:
+                best_score, best_response = score, response
+        return best_response
+
+    async def insert(self, prompt, response):
+        """Stores the response for a prompt.
+
+        Args:
+            prompt (str): The user prompt.
+            response (str): The final response to cache.
+        """
+        embedding = await self._embed(prompt)
+        if embedding is None:
+            return
+        if self._db is not None:
+            try:
+                self._db.execute(
+                    "INSERT INTO cached_responses VALUES (?, ?, ?, ?)",
+                    (self._context, prompt, embedding.tobytes(), response),
+                )
+                self._db.commit()
+            except sqlite3.Error:
+                # The response is still returned, it just isn't cached
+                return
+        self._entries.append((embedding, response))
+
+    async def _embed(self, prompt):
+        """Returns the unit-length embedding of a prompt, computing it once per prompt."""
+        if prompt not in self._embeddings:
+            try:
+                result = await self.client.aio.models.embed_content(
+                    model=EMBEDDING_MODEL, contents=prompt
+                )
+                values = result.embeddings[0].values
+                norm = math.sqrt(sum(value * value for value in values)) or 1.0
+                embedding = array.array("d", (value / norm for value in values))
+            except Exception:
+                return None
+            self._embeddings[prompt] = embedding
+        return self._embeddings[prompt]
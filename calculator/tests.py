@@ -3,8 +3,9 @@ from pkg.calculator import Calculator
 
 
 class TestCalculator(unittest.TestCase):
-    def setUp(self):
-        self.calculator = Calculator()
+    @classmethod
+    def setUpClass(cls):
+        cls.calculator = Calculator()
 
     def test_addition(self):
         result = self.calculator.evaluate("3 + 5")
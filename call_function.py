@@ -1,3 +1,6 @@
+import asyncio
+import functools
+import threading
 from google.genai import types
 
 from functions.get_files_info import get_files_info, schema_get_files_info
@@ -6,22 +9,47 @@ from functions.run_python import run_python_file, schema_run_python_file
 from functions.write_file_content import write_file, schema_write_file
 from config import WORKING_DIR
 
-available_functions = types.Tool(
-    function_declarations=[
-        schema_get_files_info,
-        schema_get_file_content,
-        schema_run_python_file,
-        schema_write_file,
-    ]
-)
+# The functions the model can call, by name
+FUNCTION_MAP = {
+    "get_files_info": get_files_info,
+    "get_file_content": get_file_content,
+    "run_python_file": run_python_file,
+    "write_file": write_file,
+}
 
+# Functions without side effects, which can safely run concurrently with each other
+READ_ONLY_FUNCTIONS = frozenset({"get_files_info", "get_file_content"})
 
-def call_function(function_call_part, verbose=False):
+# Every chat session shares the working directory, so only one call with side
+# effects runs at a time across all of them
+_SIDE_EFFECT_LOCK = threading.Lock()
+
+
+@functools.cache
+def available_functions():
+    """Returns the tool exposing every function schema to the model.
+
+    Returns:
+        types.Tool: The tool with all function declarations.
+    """
+    return types.Tool(
+        function_declarations=[
+            schema_get_files_info(),
+            schema_get_file_content(),
+            schema_run_python_file(),
+            schema_write_file(),
+        ]
+    )
+
+
+def call_function(function_call_part, verbose=False, label=""):
     """Calls a function based on the provided function call part.
 
     Args:
         function_call_part (types.Part): The function call part containing the function name and arguments.
         verbose (bool, optional): Whether to print verbose output. Defaults to False.
+        label (str, optional): Prefix for the printed call, naming the prompt it belongs to.
+            Defaults to "".
 
     Returns:
         types.Content: The response from the called function.
@@ -30,19 +58,14 @@ def call_function(function_call_part, verbose=False):
     # Print the function call details if verbose is enabled
     if verbose:
         print(
-            f" - Calling function: {function_call_part.name}({function_call_part.args})"
+            f"{label} - Calling function: {function_call_part.name}({function_call_part.args})"
         )
     else:
-        print(f" - Calling function: {function_call_part.name}")
-    function_map = {
-        "get_files_info": get_files_info,
-        "get_file_content": get_file_content,
-        "run_python_file": run_python_file,
-        "write_file": write_file,
-    }
+        print(f"{label} - Calling function: {function_call_part.name}")
     # Extract the function name and arguments
     function_name = function_call_part.name
-    if function_name not in function_map:
+    function = FUNCTION_MAP.get(function_name)
+    if function is None:
         return types.Content(
             role="tool",
             parts=[
@@ -52,18 +75,113 @@ def call_function(function_call_part, verbose=False):
                 )
             ],
         )
-    # Add the working directory to the function arguments
-    args = dict(function_call_part.args)
+    # Only pass the arguments declared in the schema, so the model can't reach
+    # internal parameters, then add the working directory
+    parameters = _schema_parameters()[function_name]
+    args = {
+        name: value
+        for name, value in (function_call_part.args or {}).items()
+        if name in parameters
+    }
     args["working_directory"] = WORKING_DIR
     
-    # Call the function and get the result
-    function_result = function_map[function_name](**args)
+    # Call the function and get the result, reporting failures to the model
+    # since the chat history already holds the call and needs its response
+    try:
+        response = {"result": function(**args)}
+    except Exception as e:
+        response = {"error": f"{type(e).__name__}: {e}"}
     return types.Content(
         role="tool",
         parts=[
             types.Part.from_function_response(
                 name=function_name,
-                response={"result": function_result},
+                response=response,
             )
         ],
     )
+
+
+@functools.cache
+def _schema_parameters():
+    """Returns the parameter names declared in each function schema, by function name."""
+    return {
+        declaration.name: frozenset(declaration.parameters.properties or ())
+        for declaration in available_functions().function_declarations
+    }
+
+
+class FunctionCallScheduler:
+    """Starts function calls as they arrive, ordering them around side effects.
+
+    Read-only calls run concurrently in worker threads, only waiting for the last
+    call with side effects before them. Any other call waits for every call before
+    it, so writes and executions keep the order the model requested them in, and
+    holds a process-wide lock so it never overlaps those of other schedulers.
+
+    Args:
+        verbose (bool, optional): Whether to print verbose output. Defaults to False.
+        label (str, optional): Prefix for printed calls, naming the prompt they belong to.
+            Defaults to "".
+    """
+
+    def __init__(self, verbose=False, label=""):
+        self.verbose = verbose
+        self.label = label
+        self._tasks = []
+        self._last_side_effect = None
+        self._closed = False
+
+    def start(self, function_call_part):
+        """Schedules a function call as soon as the calls it depends on allow.
+
+        Args:
+            function_call_part (types.FunctionCall): The function call to make.
+        """
+        if function_call_part.name in READ_ONLY_FUNCTIONS:
+            dependencies = [self._last_side_effect] if self._last_side_effect else []
+        else:
+            dependencies = list(self._tasks)
+        task = asyncio.create_task(self._call(dependencies, function_call_part))
+        if function_call_part.name not in READ_ONLY_FUNCTIONS:
+            self._last_side_effect = task
+        self._tasks.append(task)
+
+    def __len__(self):
+        """Returns the number of function calls scheduled so far."""
+        return len(self._tasks)
+
+    async def results(self):
+        """Waits for every scheduled call.
+
+        Returns:
+            list[types.Content]: The responses from the called functions, in call order.
+        """
+        return await asyncio.gather(*self._tasks)
+
+    async def aclose(self):
+        """Skips the calls that haven't started yet and waits for the running ones.
+
+        Running calls can't be interrupted in their worker threads, so they are
+        waited for rather than cancelled, and no call finishes after this returns.
+        """
+        self._closed = True
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _call(self, dependencies, function_call_part):
+        if dependencies:
+            await asyncio.wait(dependencies)
+        if self._closed:
+            return None
+        if function_call_part.name in READ_ONLY_FUNCTIONS:
+            function = call_function
+        else:
+            function = _call_function_exclusive
+        return await asyncio.to_thread(function, function_call_part, self.verbose, self.label)
+
+
+def _call_function_exclusive(function_call_part, verbose=False, label=""):
+    """Calls a function with side effects while holding the process-wide lock."""
+    with _SIDE_EFFECT_LOCK:
+        return call_function(function_call_part, verbose, label)
+
@@ -1,3 +1,8 @@
 MAX_CHARS = 10000
 WORKING_DIR = "./calculator"
-MAX_ITERS = 20
\ No newline at end of file
+MAX_ITERS = 20
+MAX_OUTPUT_BYTES = 1024 * 1024
+MODEL = "gemini-2.0-flash-001"
+CONTEXT_CACHE_TTL = "3600s"
+EMBEDDING_MODEL = "text-embedding-004"
+SEMANTIC_CACHE_THRESHOLD = 0.92
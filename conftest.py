@@ -0,0 +1,7 @@
+import os
+import sys
+
+# calculator/tests.py imports `pkg` relative to the calculator working directory,
+# so make it importable when the whole suite is collected from the repository root.
+# It is appended so the root modules, such as main, are not shadowed.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "calculator"))
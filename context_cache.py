@@ -0,0 +1,88 @@
+import hashlib
+import json
+import os
+from google.genai import errors, types
+
+from config import CONTEXT_CACHE_TTL
+
+CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".gemini_cache")
+
+# Part of the error message for content below the model's minimum cacheable token count
+_TOO_SMALL = "Cached content is too small"
+
+
+async def get_or_create_cache(client, model, system_instruction, tool, cache_file=CACHE_FILE):
+    """Returns the name of an explicit context cache holding the static request prefix.
+
+    The system instruction and tools are the same on every request. They are uploaded
+    once as cached content and then referenced by name. The cache name is stored in
+    `cache_file`, keyed by a hash of the cached content. A later run reuses the cache
+    and extends it to a full TTL, so it does not expire during the run.
+
+    Args:
+        client (genai.Client): The GenAI client instance.
+        model (str): The model the cache is created for.
+        system_instruction (str): The system prompt to cache.
+        tool (types.Tool): The tool declarations to cache.
+        cache_file (str, optional): Where to store the cache name. Defaults to CACHE_FILE.
+
+    Returns:
+        str: The cache name, or None if the content cannot be cached (for example
+            because it is below the model's minimum cacheable token count).
+    """
+    key = hashlib.sha256(
+        (model + system_instruction + tool.model_dump_json()).encode("utf-8")
+    ).hexdigest()
+    stored = _read_cache_file(cache_file)
+    if stored.get("key") == key:
+        # An empty name records that the content is too small to cache
+        if not stored.get("name"):
+            return None
+        try:
+            cache = await client.aio.caches.update(
+                name=stored["name"],
+                config=types.UpdateCachedContentConfig(ttl=CONTEXT_CACHE_TTL),
+            )
+            return cache.name
+        except Exception:
+            # The cache expired or was deleted, create a new one below
+            pass
+    try:
+        cache = await client.aio.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                system_instruction=system_instruction,
+                tools=[tool],
+                ttl=CONTEXT_CACHE_TTL,
+            ),
+        )
+    except errors.ClientError as e:
+        # Only remember the permanent rejection, other errors such as an invalid
+        # API key are retried next run
+        if e.code == 400 and _TOO_SMALL in (e.message or ""):
+            _write_cache_file(cache_file, key, "")
+        return None
+    except Exception:
+        return None
+    _write_cache_file(cache_file, key, cache.name)
+    return cache.name
+
+
+def _read_cache_file(cache_file):
+    """Reads the stored cache key and name, returning an empty dict if unavailable."""
+    try:
+        with open(cache_file, "r") as f:
+            stored = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    # Anything but an object was not written by this module
+    return stored if isinstance(stored, dict) else {}
+
+
+def _write_cache_file(cache_file, key, name):
+    """Stores the cache key and name, ignoring failures since the file is only a hint."""
+    try:
+        with open(cache_file, "w") as f:
+            json.dump({"key": key, "name": name}, f)
+    except OSError:
+        pass
@@ -1,6 +1,10 @@
+import functools
 import os
 from google.genai import types
 from config import MAX_CHARS
+from functions.paths import get_abs_working_dir, is_within_directory
+
+_OUTSIDE_READ = 'Error: Cannot read "%s" as it is outside the permitted working directory'
 
 
 def get_file_content(working_directory, file_path):
@@ -14,20 +18,21 @@ def get_file_content(working_directory, file_path):
         str: The content of the file or an error message.
     """
     # Ensure the file path is within the working directory
-    abs_working_dir = os.path.abspath(working_directory)
+    abs_working_dir = get_abs_working_dir(working_directory)
     # Get the absolute file path
-    abs_file_path = os.path.abspath(os.path.join(working_directory, file_path))
+    abs_file_path = os.path.abspath(os.path.join(abs_working_dir, file_path))
     
-    # Check if the absolute file path starts with the absolute working directory
-    if not abs_file_path.startswith(abs_working_dir):
-        return f'Error: Cannot read "{file_path}" as it is outside the permitted working directory'
+    # Check if the absolute file path is contained in the absolute working directory
+    if not is_within_directory(abs_file_path, abs_working_dir):
+        return _OUTSIDE_READ % file_path
     if not os.path.isfile(abs_file_path):
         return f'Error: File not found or is not a regular file: "{file_path}"'
     try:
         # Read and return the file content, truncated to MAX_CHARS
         with open(abs_file_path, "r") as f:
             content = f.read(MAX_CHARS)
-            if os.path.getsize(abs_file_path) > MAX_CHARS:
+            # Anything left after MAX_CHARS means the file was truncated
+            if f.read(1):
                 content += (
                     f'[...File "{file_path}" truncated at {MAX_CHARS} characters]'
                 )
@@ -35,18 +40,22 @@ def get_file_content(working_directory, file_path):
     except Exception as e:
         return f'Error reading file "{file_path}": {e}'
 
+
 # Define the function schema for integration with Google GenAI
-schema_get_file_content = types.FunctionDeclaration(
-    name="get_file_content",
-    description=f"Reads and returns the first {MAX_CHARS} characters of the content from a specified file within the working directory.",
-    parameters=types.Schema(
-        type=types.Type.OBJECT,
-        properties={
-            "file_path": types.Schema(
-                type=types.Type.STRING,
-                description="The path to the file whose content should be read, relative to the working directory.",
-            ),
-        },
-        required=["file_path"],
-    ),
-)
\ No newline at end of file
+@functools.cache
+def schema_get_file_content():
+    """Returns the get_file_content declaration, built on first use."""
+    return types.FunctionDeclaration(
+        name="get_file_content",
+        description=f"Reads and returns the first {MAX_CHARS} characters of the content from a specified file within the working directory.",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "file_path": types.Schema(
+                    type=types.Type.STRING,
+                    description="The path to the file whose content should be read, relative to the working directory.",
+                ),
+            },
+            required=["file_path"],
+        ),
+    )
\ No newline at end of file
@@ -1,5 +1,9 @@
+import functools
 import os
 from google.genai import types
+from functions.paths import get_abs_working_dir, is_within_directory
+
+_OUTSIDE_LIST = 'Error: Cannot list "%s" as it is outside the permitted working directory'
 
 
 def get_files_info(working_directory, directory="."):
@@ -13,40 +17,37 @@ def get_files_info(working_directory, directory="."):
         str: A list of files and their sizes, or an error message.
     """
     # Ensure the directory is within the working directory    
-    abs_working_dir = os.path.abspath(working_directory)
-    target_dir = os.path.abspath(os.path.join(working_directory, directory))
-    if not target_dir.startswith(abs_working_dir):
-        return f'Error: Cannot list "{directory}" as it is outside the permitted working directory'
+    abs_working_dir = get_abs_working_dir(working_directory)
+    target_dir = os.path.abspath(os.path.join(abs_working_dir, directory))
+    if not is_within_directory(target_dir, abs_working_dir):
+        return _OUTSIDE_LIST % directory
     if not os.path.isdir(target_dir):
         return f'Error: "{directory}" is not a directory'
     try:
-        # List files in the target directory
-        files_info = []
-        # Iterate over files and get their sizes
-        for filename in os.listdir(target_dir):
-            filepath = os.path.join(target_dir, filename)
-            file_size = 0
-            is_dir = os.path.isdir(filepath)
-            file_size = os.path.getsize(filepath)
-            # Append file info to the list
-            files_info.append(
-                f"- {filename}: file_size={file_size} bytes, is_dir={is_dir}"
+        # Scan the target directory once; DirEntry caches the file type and stat data
+        with os.scandir(target_dir) as entries:
+            return "\n".join(
+                f"- {entry.name}: file_size={entry.stat().st_size} bytes, is_dir={entry.is_dir()}"
+                for entry in entries
             )
-        return "\n".join(files_info)
     except Exception as e:
         return f"Error listing files: {e}"
 
+
 # Define the function schema for integration with Google GenAI
-schema_get_files_info = types.FunctionDeclaration(
-    name="get_files_info",
-    description="Lists files in the specified directory along with their sizes, constrained to the working directory.",
-    parameters=types.Schema(
-        type=types.Type.OBJECT,
-        properties={
-            "directory": types.Schema(
-                type=types.Type.STRING,
-                description="The directory to list files from, relative to the working directory. If not provided, lists files in the working directory itself.",
-            ),
-        },
-    ),
-)
+@functools.cache
+def schema_get_files_info():
+    """Returns the get_files_info declaration, built on first use."""
+    return types.FunctionDeclaration(
+        name="get_files_info",
+        description="Lists files in the specified directory along with their sizes, constrained to the working directory.",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "directory": types.Schema(
+                    type=types.Type.STRING,
+                    description="The directory to list files from, relative to the working directory. If not provided, lists files in the working directory itself.",
+                ),
+            },
+        ),
+    )
@@ -0,0 +1,38 @@
+import functools
+import os
+
+
+@functools.lru_cache(maxsize=16)
+def get_abs_working_dir(working_directory):
+    """Returns the absolute path of the working directory.
+
+    The working directory is invariant for the lifetime of the process, so the
+    normalization is computed once and cached.
+
+    Args:
+        working_directory (str): The path to the working directory.
+
+    Returns:
+        str: The absolute path of the working directory.
+    """
+    return os.path.abspath(working_directory)
+
+
+def is_within_directory(abs_path, abs_directory):
+    """Checks whether an absolute path is contained in an absolute directory.
+
+    Args:
+        abs_path (str): The absolute path to check.
+        abs_directory (str): The absolute directory that should contain the path.
+
+    Returns:
+        bool: True if the path is the directory itself or lies inside it.
+    """
+    # The trailing separator keeps sibling directories sharing a name prefix out
+    return (abs_path + os.sep).startswith(_directory_prefix(abs_directory))
+
+
+@functools.lru_cache(maxsize=16)
+def _directory_prefix(abs_directory):
+    """Returns the absolute directory with exactly one trailing separator."""
+    return os.path.join(abs_directory, "")
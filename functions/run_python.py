@@ -1,77 +1,214 @@
+import contextlib
+import functools
+import io
 import os
+import runpy
+import signal
 import subprocess
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
 from google.genai import types
+from config import MAX_OUTPUT_BYTES
+from functions.paths import get_abs_working_dir, is_within_directory
 
+_OUTSIDE_EXECUTE = 'Error: Cannot execute "%s" as it is outside the permitted working directory'
 
-def run_python_file(working_directory, file_path, args=None):
+
+def run_python_file(working_directory, file_path, args=None, sandbox=True):
     """Executes a Python file within the working directory and returns the output from the interpreter.
 
     Args:
         working_directory (str): The path to the working directory.
         file_path (str): The path to the Python file to execute, relative to the working directory.
         args (list, optional): A list of arguments to pass to the Python file. Defaults to None.
+        sandbox (bool, optional): Whether to run the file in a separate interpreter process.
+            Only disable this for trusted scripts. Defaults to True.
 
     Returns:
         str: The output from the Python interpreter or an error message.
     """
+    # Reject non-Python files before doing any path work
+    if not file_path.endswith(".py"):
+        return f'Error: "{file_path}" is not a Python file.'
+    args = args or []
     # Ensure the file is within the working directory
-    abs_working_dir = os.path.abspath(working_directory)
-    abs_file_path = os.path.abspath(os.path.join(working_directory, file_path))
-    if not abs_file_path.startswith(abs_working_dir):
-        return f'Error: Cannot execute "{file_path}" as it is outside the permitted working directory'
+    abs_working_dir = get_abs_working_dir(working_directory)
+    abs_file_path = os.path.abspath(os.path.join(abs_working_dir, file_path))
+    if not is_within_directory(abs_file_path, abs_working_dir):
+        return _OUTSIDE_EXECUTE % file_path
     if not os.path.exists(abs_file_path):
         return f'Error: File "{file_path}" not found.'
-    if not file_path.endswith(".py"):
-        return f'Error: "{file_path}" is not a Python file.'
     try:
-        # Execute the Python file using subprocess
-        commands = ["python", abs_file_path]
-        
-        # Append any additional arguments
-        if args:
-            commands.extend(args)
+        # Run trusted scripts in the current interpreter instead of a new process
+        if not sandbox:
+            return _format_output(*_run_in_process(abs_working_dir, abs_file_path, args))
+        # Execute the Python file with the current interpreter, skipping the user
+        # site directory and PYTHON* environment variables to speed up startup
+        commands = [sys.executable, "-s", "-E", abs_file_path, *args]
         # Run the command and capture output
-        result = subprocess.run(
-            commands,
-            capture_output=True,
-            text=True,
-            timeout=30,
-            cwd=abs_working_dir,
-        )
-        output = []
-        # Collect stdout and stderr
-        if result.stdout:
-            output.append(f"STDOUT:\n{result.stdout}")
-        if result.stderr:
-            output.append(f"STDERR:\n{result.stderr}")
-        # Include return code if non-zero
-        if result.returncode != 0:
-            output.append(f"Process exited with code {result.returncode}")
-        # Return the combined output
-        return "\n".join(output) if output else "No output produced."
+        return _format_output(*_run_subprocess(commands, abs_working_dir))
     except Exception as e:
         return f"Error: executing Python file: {e}"
 
+
+def _run_subprocess(commands, abs_working_dir, timeout=30):
+    """Runs a command, capturing at most MAX_OUTPUT_BYTES of stdout and of stderr.
+
+    The process is killed as soon as either stream exceeds the cap, so a runaway
+    script cannot exhaust memory before the timeout expires. It runs in its own
+    process group, so the processes it started are killed with it once it ends.
+
+    Args:
+        commands (list[str]): The command line to execute.
+        abs_working_dir (str): The absolute path to run the command in.
+        timeout (int, optional): Seconds to wait before killing the process. Defaults to 30.
+
+    Raises:
+        subprocess.TimeoutExpired: If the process does not finish within the timeout.
+
+    Returns:
+        tuple: The (stdout, stderr, returncode) of the process.
+    """
+    with subprocess.Popen(
+        commands,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=abs_working_dir,
+        start_new_session=True,
+    ) as process, ThreadPoolExecutor(max_workers=2) as pool:
+        # Drain both pipes concurrently so neither can fill up and block the child
+        stdout = pool.submit(_read_capped, process, process.stdout, "STDOUT")
+        stderr = pool.submit(_read_capped, process, process.stderr, "STDERR")
+        try:
+            returncode = process.wait(timeout=timeout)
+        finally:
+            # Leftover children would hold the pipes open and block the readers
+            _kill_process_group(process)
+        return stdout.result(), stderr.result(), returncode
+
+
+def _read_capped(process, stream, name):
+    """Reads a process output stream, killing the process if it exceeds MAX_OUTPUT_BYTES.
+
+    Args:
+        process (subprocess.Popen): The process writing to the stream.
+        stream (io.BufferedReader): The stream to read from.
+        name (str): The stream name used in the truncation message.
+
+    Returns:
+        str: The decoded output, with a truncation note if the cap was hit.
+    """
+    data = bytearray()
+    while chunk := stream.read1():
+        data += chunk
+        if len(data) > MAX_OUTPUT_BYTES:
+            _kill_process_group(process)
+            del data[MAX_OUTPUT_BYTES:]
+            output = data.decode(errors="replace")
+            return output + f"[...{name} truncated at {MAX_OUTPUT_BYTES} bytes]"
+    return data.decode(errors="replace")
+
+
+def _kill_process_group(process):
+    """Kills a process started in its own session and every process in its group."""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def _run_in_process(abs_working_dir, abs_file_path, args):
+    """Runs a Python file as __main__ in the current interpreter.
+
+    Args:
+        abs_working_dir (str): The absolute path to the working directory.
+        abs_file_path (str): The absolute path to the Python file to execute.
+        args (list): Arguments to pass to the Python file.
+
+    Returns:
+        tuple: The (stdout, stderr, returncode) of the run. As in a fresh interpreter,
+            an uncaught exception is printed to stderr and gives returncode 1.
+    """
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    returncode = 0
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(contextlib.chdir(abs_working_dir))
+        stack.enter_context(_patched_sys(abs_file_path, args))
+        stack.enter_context(contextlib.redirect_stdout(stdout))
+        stack.enter_context(contextlib.redirect_stderr(stderr))
+        try:
+            runpy.run_path(abs_file_path, run_name="__main__")
+        except SystemExit as e:
+            # Mirror the interpreter: integers are exit codes, anything else is printed
+            if isinstance(e.code, int):
+                returncode = e.code
+            elif e.code is not None:
+                print(e.code, file=sys.stderr)
+                returncode = 1
+        except Exception:
+            traceback.print_exc()
+            returncode = 1
+    return stdout.getvalue(), stderr.getvalue(), returncode
+
+
+@contextlib.contextmanager
+def _patched_sys(abs_file_path, args):
+    """Sets up sys.argv, sys.path and sys.modules as a fresh interpreter would."""
+    saved_argv = sys.argv
+    saved_path = sys.path[:]
+    saved_modules = set(sys.modules)
+    sys.argv = [abs_file_path, *args]
+    sys.path.insert(0, os.path.dirname(abs_file_path))
+    try:
+        yield
+    finally:
+        sys.argv = saved_argv
+        sys.path[:] = saved_path
+        # Drop modules imported by the script so they don't leak into later runs
+        for name in set(sys.modules) - saved_modules:
+            del sys.modules[name]
+
+
+def _format_output(stdout, stderr, returncode):
+    """Combines the captured output of a Python run into a single string."""
+    output = []
+    # Collect stdout and stderr
+    if stdout:
+        output.append(f"STDOUT:\n{stdout}")
+    if stderr:
+        output.append(f"STDERR:\n{stderr}")
+    # Include return code if non-zero
+    if returncode != 0:
+        output.append(f"Process exited with code {returncode}")
+    # Return the combined output
+    return "\n".join(output) if output else "No output produced."
+
+
 # Define the function schema for integration with Google GenAI
-schema_run_python_file = types.FunctionDeclaration(
-    name="run_python_file",
-    description="Executes a Python file within the working directory and returns the output from the interpreter.",
-    parameters=types.Schema(
-        type=types.Type.OBJECT,
-        properties={
-            "file_path": types.Schema(
-                type=types.Type.STRING,
-                description="Path to the Python file to execute, relative to the working directory.",
-            ),
-            "args": types.Schema(
-                type=types.Type.ARRAY,
-                items=types.Schema(
+@functools.cache
+def schema_run_python_file():
+    """Returns the run_python_file declaration, built on first use."""
+    return types.FunctionDeclaration(
+        name="run_python_file",
+        description="Executes a Python file within the working directory and returns the output from the interpreter.",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "file_path": types.Schema(
                     type=types.Type.STRING,
+                    description="Path to the Python file to execute, relative to the working directory.",
+                ),
+                "args": types.Schema(
+                    type=types.Type.ARRAY,
+                    items=types.Schema(
+                        type=types.Type.STRING,
+                        description="Optional arguments to pass to the Python file.",
+                    ),
                     description="Optional arguments to pass to the Python file.",
                 ),
-                description="Optional arguments to pass to the Python file.",
-            ),
-        },
-        required=["file_path"],
-    ),
-)
+            },
+            required=["file_path"],
+        ),
+    )
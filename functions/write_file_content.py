@@ -1,5 +1,11 @@
+import functools
 import os
+import secrets
+import stat
 from google.genai import types
+from functions.paths import get_abs_working_dir, is_within_directory
+
+_OUTSIDE_WRITE = 'Error: Cannot write to "%s" as it is outside the permitted working directory'
 
 
 def write_file(working_directory, file_path, content):
@@ -15,45 +21,82 @@ def write_file(working_directory, file_path, content):
     """
     # Ensure the file is within the working directory
     
-    abs_working_dir = os.path.abspath(working_directory)
-    abs_file_path = os.path.abspath(os.path.join(working_directory, file_path))
-    if not abs_file_path.startswith(abs_working_dir):
-        return f'Error: Cannot write to "{file_path}" as it is outside the permitted working directory'
-    if not os.path.exists(abs_file_path):
-        try:
-            # Create directories if they don't exist
-            os.makedirs(os.path.dirname(abs_file_path), exist_ok=True)
-        except Exception as e:
-            return f"Error: creating directory: {e}"
-    # If we created the directory, we need to create the file
-    if os.path.exists(abs_file_path) and os.path.isdir(abs_file_path):
+    abs_working_dir = get_abs_working_dir(working_directory)
+    abs_file_path = os.path.abspath(os.path.join(abs_working_dir, file_path))
+    if not is_within_directory(abs_file_path, abs_working_dir):
+        return _OUTSIDE_WRITE % file_path
+    try:
+        # Create parent directories if they don't exist
+        os.makedirs(os.path.dirname(abs_file_path), exist_ok=True)
+    except Exception as e:
+        return f"Error: creating directory: {e}"
+    if os.path.isdir(abs_file_path):
         return f'Error: "{file_path}" is a directory, not a file'
     try:
-        # Write the content to the file
-        with open(abs_file_path, "w") as f:
-            f.write(content)
+        # Encode once, before touching the disk
+        data = memoryview(content.encode("utf-8"))
+    except Exception as e:
+        return f"Error: writing to file: {e}"
+    tmp_file_path = None
+    try:
+        # Write to a fresh temporary file next to the target, then atomically swap it in
+        fd, tmp_file_path = _create_temp_file(os.path.dirname(abs_file_path))
+        try:
+            # Keep the mode of an existing file, a new one already has the mode open() gives
+            try:
+                os.fchmod(fd, stat.S_IMODE(os.stat(abs_file_path).st_mode))
+            except FileNotFoundError:
+                pass
+            while data:
+                data = data[os.write(fd, data):]
+        finally:
+            os.close(fd)
+        os.replace(tmp_file_path, abs_file_path)
         return (
             f'Successfully wrote to "{file_path}" ({len(content)} characters written)'
         )
     except Exception as e:
+        if tmp_file_path is not None and os.path.exists(tmp_file_path):
+            os.remove(tmp_file_path)
         return f"Error: writing to file: {e}"
 
+
+def _create_temp_file(directory):
+    """Creates a uniquely named file in a directory, with the mode the umask gives new files.
+
+    Args:
+        directory (str): The directory to create the file in.
+
+    Returns:
+        tuple: The open file descriptor and the path of the file.
+    """
+    while True:
+        path = os.path.join(directory, f"tmp{secrets.token_hex(8)}")
+        try:
+            return os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666), path
+        except FileExistsError:
+            continue
+
+
 # Define the function schema for integration with Google GenAI
-schema_write_file = types.FunctionDeclaration(
-    name="write_file",
-    description="Writes content to a file within the working directory. Creates the file if it doesn't exist.",
-    parameters=types.Schema(
-        type=types.Type.OBJECT,
-        properties={
-            "file_path": types.Schema(
-                type=types.Type.STRING,
-                description="Path to the file to write, relative to the working directory.",
-            ),
-            "content": types.Schema(
-                type=types.Type.STRING,
-                description="Content to write to the file",
-            ),
-        },
-        required=["file_path", "content"],
-    ),
-)
+@functools.cache
+def schema_write_file():
+    """Returns the write_file declaration, built on first use."""
+    return types.FunctionDeclaration(
+        name="write_file",
+        description="Writes content to a file within the working directory. Creates the file if it doesn't exist.",
+        parameters=types.Schema(
+            type=types.Type.OBJECT,
+            properties={
+                "file_path": types.Schema(
+                    type=types.Type.STRING,
+                    description="Path to the file to write, relative to the working directory.",
+                ),
+                "content": types.Schema(
+                    type=types.Type.STRING,
+                    description="Content to write to the file",
+                ),
+            },
+            required=["file_path", "content"],
+        ),
+    )
@@ -1,109 +1,357 @@
+import argparse
+import asyncio
+import functools
 import sys
 import os
-from google import genai
-from google.genai import types
-from dotenv import load_dotenv
 
-from call_function import call_function, available_functions
-
-from config import MAX_ITERS
+from agent_cache import SemanticCache
+from config import MAX_ITERS, MODEL
 from prompts import system_prompt
 
-def main():
-    # Load environment variables from .env file
-    load_dotenv()
+# The GenAI SDK, dotenv and the tool modules are imported where they are first used,
+# so argument errors, --help and importing this module stay fast.
 
-    verbose = "--verbose" in sys.argv
-    args = []
-    for arg in sys.argv[1:]:
-        if not arg.startswith("--"):
-            args.append(arg)
 
-    if not args:
-        print("AI Code Assistant")
-        print('\nUsage: python main.py "your prompt here" [--verbose]')
-        print('Example: python main.py "How do I fix the calculator?"')
-        sys.exit(1)
+@functools.lru_cache(maxsize=1)
+def _get_client():
+    """Returns the shared GenAI client, creating it on first use.
+
+    Reusing one client keeps its HTTP connection pool alive across requests.
+
+    Returns:
+        genai.Client: The GenAI client instance.
+    """
+    from google import genai
+
+    return genai.Client(api_key=_load_env())
+
+
+def _load_env():
+    """Returns the Gemini API key, reading the .env file only if it is not exported.
+
+    Returns:
+        str: The API key, or None if it is not configured.
+    """
+    if "GEMINI_API_KEY" not in os.environ:
+        from dotenv import load_dotenv
+
+        # Load environment variables from .env file, exported values take precedence
+        load_dotenv(override=False)
+    return os.environ.get("GEMINI_API_KEY")
+
+
+@functools.lru_cache(maxsize=1)
+def _get_config(client):
+    """Returns a task resolving to the shared request config.
+
+    The task is created once, so prompts running concurrently share one context
+    cache lookup instead of each creating a cache.
+
+    Args:
+        client (genai.Client): The GenAI client instance.
+
+    Returns:
+        asyncio.Task: Resolves to the types.GenerateContentConfig used for every request.
+    """
+    return asyncio.ensure_future(_create_config(client))
+
+
+async def _create_config(client):
+    """Creates the request config with the tools and system instruction.
+
+    The static system instruction and tools are referenced through an explicit
+    context cache when possible, so they are not re-sent with every request.
+    Any failure falls back to sending them inline, since the shared task would
+    otherwise fail every prompt.
+
+    Args:
+        client (genai.Client): The GenAI client instance.
+
+    Returns:
+        types.GenerateContentConfig: The config used for every request.
+    """
+    from google.genai import types
+    from call_function import available_functions
+    from context_cache import get_or_create_cache
+
+    try:
+        cache_name = await get_or_create_cache(
+            client, MODEL, system_prompt, available_functions()
+        )
+    except Exception:
+        cache_name = None
+    if cache_name:
+        return types.GenerateContentConfig(cached_content=cache_name)
+    return types.GenerateContentConfig(
+        tools=[available_functions()], system_instruction=system_prompt
+    )
+
+
+def parse_args(argv=None):
+    """Parses the command line arguments in a single pass.
+
+    Args:
+        argv (list[str], optional): The arguments to parse. Defaults to sys.argv[1:].
+
+    Returns:
+        argparse.Namespace: The parsed arguments with `prompt`, `verbose`,
+            `prompts_file`, `concurrency` and `no_cache`.
+    """
+    parser = argparse.ArgumentParser(
+        description="AI Code Assistant",
+        epilog='Example: python main.py "How do I fix the calculator?"',
+    )
+    parser.add_argument("prompt", nargs="*", help="the prompt to send to the agent")
+    parser.add_argument("--verbose", action="store_true", help="print verbose output")
+    parser.add_argument(
+        "--prompts-file", help="run every line of this file as a separate prompt"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="maximum number of prompts from --prompts-file to run at once (default: 8)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="don't reuse or store responses for similar earlier prompts",
+    )
+    args = parser.parse_intermixed_args(argv)
+    if bool(args.prompt) == bool(args.prompts_file):
+        parser.error("provide either a prompt or --prompts-file")
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    return args
+
 
-    api_key = os.environ.get("GEMINI_API_KEY")
-    client = genai.Client(api_key=api_key)
+async def main():
+    args = parse_args()
 
-    user_prompt = " ".join(args)
+    client = _get_client()
+    # Responses depend on the model and system prompt, so they are cached per pair
+    cache = None if args.no_cache else SemanticCache(client, context=MODEL + system_prompt)
+
+    if args.prompts_file:
+        await run_prompts_file(
+            client, args.prompts_file, args.concurrency, args.verbose, cache
+        )
+        return
+
+    user_prompt = " ".join(args.prompt)
+    verbose = args.verbose
 
     if verbose:
         print(f"User prompt: {user_prompt}\n")
 
-    # Create initial user message
-    messages = [
-        types.Content(role="user", parts=[types.Part(text=user_prompt)]),
-    ]
-    
-    # Main interaction loop
-    iters = 0
-    while True:
-        iters += 1
-        if iters > MAX_ITERS:
-            print(f"Maximum iterations ({MAX_ITERS}) reached.")
-            sys.exit(1)
+    final_response = await run_agent(client, user_prompt, verbose, cache=cache)
+    if final_response is None:
+        print(f"Maximum iterations ({MAX_ITERS}) reached.")
+        sys.exit(1)
+    # The response text was already streamed, finish its line
+    print()
+
+
+async def run_prompts_file(client, prompts_file, concurrency, verbose, cache=None):
+    """Runs every prompt in a file through the agent in one process.
+
+    Each non-empty line is an independent prompt with its own chat session. Up to
+    `concurrency` prompts run at once, and the final responses are printed in the
+    order of the file. Output printed while the prompts run is prefixed with the
+    prompt's number, and a prompt that fails is reported without stopping the others.
+
+    Args:
+        client (genai.Client): The GenAI client instance.
+        prompts_file (str): The path to the file with one prompt per line.
+        concurrency (int): The maximum number of prompts to run at once.
+        verbose (bool): Whether to print verbose output.
+        cache (SemanticCache, optional): The response cache to use. Defaults to None.
+    """
+    with open(prompts_file, "r") as f:
+        prompts = [line.strip() for line in f if line.strip()]
+    semaphore = asyncio.Semaphore(concurrency)
 
+    async def run_one(label, user_prompt):
+        async with semaphore:
+            return await run_agent(
+                client, user_prompt, verbose, echo=False, cache=cache, label=label
+            )
+
+    labels = [f"[{number}]" for number in range(1, len(prompts) + 1)]
+    final_responses = await asyncio.gather(
+        *(run_one(label, prompt) for label, prompt in zip(labels, prompts)),
+        return_exceptions=True,
+    )
+    for label, user_prompt, final_response in zip(labels, prompts, final_responses):
+        print(f"{label} User prompt: {user_prompt}")
+        if isinstance(final_response, Exception):
+            print(f"Error: {final_response}\n")
+        elif final_response is None:
+            print(f"Maximum iterations ({MAX_ITERS}) reached.\n")
+        else:
+            print(f"{final_response}\n")
+
+
+async def run_agent(client, user_prompt, verbose, echo=True, cache=None, label=""):
+    """Runs the agent loop for a prompt until the model gives a final response.
+
+    If a cache is given, a response cached for a similar prompt is returned without
+    calling the model. Final responses given without any function calls are added
+    to the cache, responses that depended on tool results are not.
+
+    Args:
+        client (genai.Client): The GenAI client instance.
+        user_prompt (str): The prompt to send to the agent.
+        verbose (bool): Whether to print verbose output.
+        echo (bool, optional): Whether to print response text as it streams. Defaults to True.
+        cache (SemanticCache, optional): The response cache to use. Defaults to None.
+        label (str, optional): Prefix for printed progress, naming the prompt. Defaults to "".
+
+    Returns:
+        str: The final response, or None if MAX_ITERS was reached first.
+    """
+    if cache:
+        cached_response = await cache.lookup(user_prompt)
+        if cached_response:
+            if echo:
+                print(cached_response, end="")
+            return cached_response
+
+    # The chat session keeps the conversation history between turns
+    config = await _get_config(client)
+    chat = client.aio.chats.create(model=MODEL, config=config)
+    message = user_prompt
+    called_functions = False
+
+    # Main interaction loop
+    for _ in range(MAX_ITERS):
         try:
             # Generate content and handle function calls
-            final_response = generate_content(client, messages, verbose)
+            final_response, function_responses = await generate_content(
+                chat, message, verbose, echo, label
+            )
             if final_response:
-                print("Final response:")
-                print(final_response)
-                break
+                if cache and not called_functions:
+                    await cache.insert(user_prompt, final_response)
+                return final_response
+            if function_responses:
+                # Continue from the history with the streamed model turn merged, the
+                # chat session's own history is left untouched
+                history = _coalesce_model_turn(chat.get_history(curated=True))
+                chat = client.aio.chats.create(model=MODEL, config=config, history=history)
+                message = function_responses
+                called_functions = True
         except Exception as e:
-            print(f"Error in generate_content: {e}")
+            print(f"{label} Error in generate_content: {e}".lstrip())
+    return None
+
 
+async def generate_content(chat, message, verbose, echo=True, label=""):
+    """Send a message in the chat session and handle the response.
 
-def generate_content(client, messages, verbose):
-    """Generate content using the GenAI client.
+    The response is streamed: text is printed as it arrives (if `echo` is set) and
+    each function call is started as soon as it is received, with independent
+    read-only calls running concurrently.
 
     Args:
-        client (genai.Client): The GenAI client instance.
-        messages (list[types.Content]): The list of messages to include in the request.
+        chat (chats.AsyncChat): The chat session holding the conversation history.
+        message (str | list[types.Part]): The user prompt or the function responses to send.
         verbose (bool): Whether to print verbose output.
+        echo (bool, optional): Whether to print response text as it streams. Defaults to True.
+        label (str, optional): Prefix for printed progress, naming the prompt. Defaults to "".
 
     Raises:
         Exception: If the API request fails or returns an error.
 
     Returns:
-        str: The generated content from the API response.
+        tuple: The final response text and None, or None and the function
+            response parts to send on the next turn.
     """
-    # Call the generate_content function with tools and system instruction
-    response = client.models.generate_content(
-        model="gemini-2.0-flash-001",
-        contents=messages,
-        config=types.GenerateContentConfig(
-            tools=[available_functions], system_instruction=system_prompt
-        ),
-    )
-    # Check for errors in the response
-    if response.candidates:
-        for candidate in response.candidates:
-            function_call_content = candidate.content
-            messages.append(function_call_content)
-
-    if not response.function_calls:
-        return response.text
-    
+    from call_function import FunctionCallScheduler
+
+    scheduler = FunctionCallScheduler(verbose, label)
+    text_parts = []
+    mid_line = False
+    try:
+        # Stream the response, the chat session supplies the history and config
+        stream = await chat.send_message_stream(message)
+        # Single pass over the streamed parts, the chat session records them as history
+        async for chunk in stream:
+            if not chunk.candidates or not chunk.candidates[0].content:
+                continue
+            for part in chunk.candidates[0].content.parts or ():
+                function_call = part.function_call
+                if function_call:
+                    if mid_line:
+                        print()
+                        mid_line = False
+                    # Start the call while the model is still streaming
+                    scheduler.start(function_call)
+                elif part.text:
+                    text_parts.append(part.text)
+                    if echo:
+                        print(part.text, end="", flush=True)
+                        mid_line = True
+
+        if not scheduler:
+            return "".join(text_parts), None
+
+        function_call_results = await scheduler.results()
+    finally:
+        # Don't leave calls running behind a failed turn, their writes would land later
+        await scheduler.aclose()
+
     # Handle function calls
     function_responses = []
-    for function_call_part in response.function_calls:
-        function_call_result = call_function(function_call_part, verbose)
-        if (
-            not function_call_result.parts
-            or not function_call_result.parts[0].function_response
-        ):
+    for function_call_result in function_call_results:
+        part = function_call_result.parts[0] if function_call_result.parts else None
+        if not part or not part.function_response:
             raise Exception("empty function call result")
         if verbose:
-            print(f"-> {function_call_result.parts[0].function_response.response}")
-        function_responses.append(function_call_result.parts[0])
+            print(f"{label} -> {part.function_response.response}".lstrip())
+        function_responses.append(part)
 
     if not function_responses:
         raise Exception("no function responses generated, exiting.")
+    return None, function_responses
+
+
+def _coalesce_model_turn(history):
+    """Merges the streamed chunks of the last model turn into a single content.
+
+    The chat session records every streamed chunk as its own model turn, with text
+    split at arbitrary chunk boundaries. Merging them makes the history, and so the
+    prompt prefix of the next request, independent of how the response happened to
+    be chunked, which lets Gemini's implicit prefix caching match it.
+
+    Args:
+        history (list[types.Content]): The curated chat history.
+
+    Returns:
+        list[types.Content]: A new history with the last model turn merged.
+    """
+    from google.genai import types
+
+    start = len(history)
+    while start > 0 and history[start - 1].role == "model":
+        start -= 1
+    if len(history) - start < 2:
+        return list(history)
+    parts = []
+    for content in history[start:]:
+        for part in content.parts or ():
+            # Join consecutive plain text parts, keep every other part as is
+            if parts and _is_plain_text(part) and _is_plain_text(parts[-1]):
+                parts[-1] = types.Part(text=parts[-1].text + part.text)
+            else:
+                parts.append(part)
+    return [*history[:start], types.Content(role="model", parts=parts)]
+
+
+def _is_plain_text(part):
+    """Returns whether a part carries nothing but text."""
+    return part.text is not None and part.model_dump(exclude_none=True).keys() == {"text"}
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    asyncio.run(main())
@@ -1,19 +1,593 @@
-from functions.run_python import run_python_file
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+from google.genai import chats, errors, types
+import call_function
+from call_function import FunctionCallScheduler
+from config import CONTEXT_CACHE_TTL, MAX_CHARS
+from agent_cache import SemanticCache
+from context_cache import get_or_create_cache
+import main
+from main import parse_args
+from functions.get_file_content import get_file_content
+from functions.run_python import _run_subprocess, run_python_file
+from functions.write_file_content import write_file
 
 
-def test():
-    result = run_python_file("calculator", "main.py")
-    print(result)
+class TestGetFileContent(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
 
-    result = run_python_file("calculator", "tests.py")
-    print(result)
+    def write(self, name, content):
+        with open(os.path.join(self.tmp_dir.name, name), "w") as f:
+            f.write(content)
 
-    result = run_python_file("calculator", "../main.py")
-    print(result)
+    def test_file_at_limit_is_not_truncated(self):
+        self.write("exact.txt", "x" * MAX_CHARS)
+        result = get_file_content(self.tmp_dir.name, "exact.txt")
+        self.assertEqual(result, "x" * MAX_CHARS)
 
-    result = run_python_file("calculator", "nonexistent.py")
-    print(result)
+    def test_file_over_limit_is_truncated(self):
+        self.write("long.txt", "x" * (MAX_CHARS + 1))
+        result = get_file_content(self.tmp_dir.name, "long.txt")
+        self.assertEqual(
+            result,
+            "x" * MAX_CHARS + f'[...File "long.txt" truncated at {MAX_CHARS} characters]',
+        )
+
+
+class TestWriteFile(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.tmp_dir.name, name)
+
+    def test_keeps_existing_file_mode(self):
+        with open(self.path("run.sh"), "w") as f:
+            f.write("old")
+        os.chmod(self.path("run.sh"), 0o750)
+        write_file(self.tmp_dir.name, "run.sh", "new")
+        self.assertEqual(os.stat(self.path("run.sh")).st_mode & 0o777, 0o750)
+
+    def test_new_file_gets_default_mode(self):
+        umask = os.umask(0o027)
+        self.addCleanup(os.umask, umask)
+        write_file(self.tmp_dir.name, "new.txt", "new")
+        self.assertEqual(os.stat(self.path("new.txt")).st_mode & 0o777, 0o640)
+
+    def test_failure_leaves_neighbouring_files_alone(self):
+        with open(self.path("notes.tmp"), "w") as f:
+            f.write("keep")
+        with mock.patch("os.replace", side_effect=OSError("disk full")):
+            result = write_file(self.tmp_dir.name, "notes", "new")
+        self.assertEqual(result, "Error: writing to file: disk full")
+        self.assertEqual(sorted(os.listdir(self.tmp_dir.name)), ["notes.tmp"])
+        with open(self.path("notes.tmp")) as f:
+            self.assertEqual(f.read(), "keep")
+
+
+class TestRunPythonFile(unittest.TestCase):
+    def test_run_main_without_args(self):
+        result = run_python_file("calculator", "main.py", sandbox=False)
+        self.assertIn("Calculator App", result)
+
+    def test_run_main_with_args(self):
+        result = run_python_file("calculator", "main.py", ["3 + 5"], sandbox=False)
+        self.assertIn('"result": 8', result)
+
+    def test_run_main_sandboxed(self):
+        result = run_python_file("calculator", "main.py", ["3 + 5"])
+        self.assertIn('"result": 8', result)
+
+    def test_in_process_failure_runs_once(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with open(os.path.join(tmp_dir, "fail.py"), "w") as f:
+                f.write("open('log.txt', 'a').write('ran\\n')\nraise ValueError('boom')\n")
+            result = run_python_file(tmp_dir, "fail.py", sandbox=False)
+            with open(os.path.join(tmp_dir, "log.txt")) as f:
+                self.assertEqual(f.read(), "ran\n")
+        self.assertIn("ValueError: boom", result)
+        self.assertTrue(result.endswith("Process exited with code 1"))
+
+    def test_background_child_does_not_block(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with open(os.path.join(tmp_dir, "spawn.py"), "w") as f:
+                f.write(
+                    "import subprocess, sys\n"
+                    "subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])\n"
+                    "print('started')\n"
+                )
+            start = time.monotonic()
+            result = run_python_file(tmp_dir, "spawn.py")
+        self.assertLess(time.monotonic() - start, 30)
+        self.assertEqual(result, "STDOUT:\nstarted\n")
+
+    def test_timeout_kills_background_child(self):
+        commands = [
+            sys.executable,
+            "-c",
+            "import subprocess, sys, time\n"
+            "subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])\n"
+            "time.sleep(60)\n",
+        ]
+        start = time.monotonic()
+        with self.assertRaises(subprocess.TimeoutExpired):
+            _run_subprocess(commands, tempfile.gettempdir(), timeout=1)
+        self.assertLess(time.monotonic() - start, 30)
+
+    def test_run_tests(self):
+        result = run_python_file("calculator", "tests.py", sandbox=False)
+        self.assertIn("Ran 9 tests", result)
+        self.assertIn("OK", result)
+
+    def test_outside_working_directory(self):
+        result = run_python_file("calculator", "../main.py")
+        self.assertTrue(result.startswith('Error: Cannot execute "../main.py"'))
+
+    def test_sibling_with_shared_prefix(self):
+        result = run_python_file("calculator", "../calculator_evil/main.py")
+        self.assertTrue(result.startswith("Error: Cannot execute"))
+
+    def test_not_a_python_file(self):
+        result = run_python_file("calculator", "README.md")
+        self.assertEqual(result, 'Error: "README.md" is not a Python file.')
+
+    def test_nonexistent_file(self):
+        result = run_python_file("calculator", "nonexistent.py")
+        self.assertEqual(result, 'Error: File "nonexistent.py" not found.')
+
+
+class TestFunctionCallScheduler(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        patcher = mock.patch("call_function.WORKING_DIR", tmp_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def call(self, *function_calls):
+        async def call_all():
+            scheduler = FunctionCallScheduler()
+            for function_call in function_calls:
+                scheduler.start(function_call)
+            return await scheduler.results()
+
+        with mock.patch("builtins.print"):
+            results = asyncio.run(call_all())
+        return [result.parts[0].function_response.response["result"] for result in results]
+
+    def test_results_keep_call_order(self):
+        results = self.call(
+            types.FunctionCall(name="get_file_content", args={"file_path": "missing.txt"}),
+            types.FunctionCall(name="get_files_info", args={}),
+        )
+        self.assertTrue(results[0].startswith("Error: File not found"))
+        self.assertEqual(results[1], "")
+
+    def test_undeclared_arguments_are_dropped(self):
+        with open(os.path.join(call_function.WORKING_DIR, "pid.py"), "w") as f:
+            f.write("import os\nprint(os.getpid() != %d)\n" % os.getpid())
+        results = self.call(
+            types.FunctionCall(
+                name="run_python_file", args={"file_path": "pid.py", "sandbox": False}
+            )
+        )
+        self.assertEqual(results[0], "STDOUT:\nTrue\n")
+
+    def test_side_effects_do_not_overlap_across_schedulers(self):
+        running = 0
+        max_running = 0
+
+        def write_file(**kwargs):
+            nonlocal running, max_running
+            running += 1
+            max_running = max(max_running, running)
+            time.sleep(0.05)
+            running -= 1
+            return "ok"
+
+        async def call_all():
+            schedulers = [FunctionCallScheduler(label=f"[{number}]") for number in range(3)]
+            for scheduler in schedulers:
+                scheduler.start(
+                    types.FunctionCall(name="write_file", args={"file_path": "a.txt", "content": "hi"})
+                )
+            return await asyncio.gather(*(scheduler.results() for scheduler in schedulers))
+
+        with mock.patch.dict(call_function.FUNCTION_MAP, {"write_file": write_file}), mock.patch(
+            "builtins.print"
+        ) as print_mock:
+            asyncio.run(call_all())
+        self.assertEqual(max_running, 1)
+        self.assertIn(mock.call("[1] - Calling function: write_file"), print_mock.call_args_list)
+
+    def test_tool_exception_becomes_error_response(self):
+        with mock.patch.dict(
+            call_function.FUNCTION_MAP, {"get_files_info": mock.Mock(side_effect=OSError("disk gone"))}
+        ), mock.patch("builtins.print"):
+            result = call_function.call_function(types.FunctionCall(name="get_files_info", args={}))
+        self.assertEqual(
+            result.parts[0].function_response.response, {"error": "OSError: disk gone"}
+        )
+
+    def test_read_after_write_sees_written_content(self):
+        results = self.call(
+            types.FunctionCall(name="get_file_content", args={"file_path": "a.txt"}),
+            types.FunctionCall(name="write_file", args={"file_path": "a.txt", "content": "hi"}),
+            types.FunctionCall(name="get_file_content", args={"file_path": "a.txt"}),
+        )
+        self.assertTrue(results[0].startswith("Error: File not found"))
+        self.assertEqual(results[2], "hi")
+
+    def test_failed_stream_skips_pending_calls(self):
+        async def stream():
+            yield types.GenerateContentResponse(
+                candidates=[
+                    types.Candidate(
+                        content=types.Content(
+                            role="model",
+                            parts=[
+                                types.Part(function_call=types.FunctionCall(name="get_files_info", args={})),
+                                types.Part(
+                                    function_call=types.FunctionCall(
+                                        name="write_file", args={"file_path": "a.txt", "content": "hi"}
+                                    )
+                                ),
+                            ],
+                        )
+                    )
+                ]
+            )
+            raise errors.ServerError(503, {})
+
+        chat = mock.Mock()
+        chat.send_message_stream = mock.AsyncMock(return_value=stream())
+        with mock.patch("builtins.print"), self.assertRaises(errors.ServerError):
+            asyncio.run(main.generate_content(chat, "hi", False))
+        self.assertFalse(os.path.exists(os.path.join(call_function.WORKING_DIR, "a.txt")))
+
+
+class TestContextCache(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.cache_file = os.path.join(tmp_dir.name, ".gemini_cache")
+        self.tool = types.Tool(function_declarations=[])
+        self.client = mock.Mock()
+        self.caches = self.client.aio.caches
+        self.caches.create = mock.AsyncMock(return_value=types.CachedContent(name="cachedContents/1"))
+        self.caches.update = mock.AsyncMock(return_value=types.CachedContent(name="cachedContents/1"))
+
+    def get_or_create(self):
+        return asyncio.run(
+            get_or_create_cache(self.client, "model", "prompt", self.tool, cache_file=self.cache_file)
+        )
+
+    def test_creates_then_reuses_cache(self):
+        self.assertEqual(self.get_or_create(), "cachedContents/1")
+        self.assertEqual(self.get_or_create(), "cachedContents/1")
+        self.caches.create.assert_called_once()
+        self.caches.update.assert_called_once_with(name="cachedContents/1", config=mock.ANY)
+        self.assertEqual(self.caches.update.call_args.kwargs["config"].ttl, CONTEXT_CACHE_TTL)
+
+    def test_recreates_expired_cache(self):
+        self.get_or_create()
+        self.caches.update.side_effect = errors.ClientError(404, {})
+        self.assertEqual(self.get_or_create(), "cachedContents/1")
+        self.assertEqual(self.caches.create.call_count, 2)
+
+    def test_remembers_uncacheable_content(self):
+        self.caches.create.side_effect = errors.ClientError(
+            400, {"error": {"code": 400, "message": "Cached content is too small. total_token_count=10"}}
+        )
+        self.assertIsNone(self.get_or_create())
+        self.assertIsNone(self.get_or_create())
+        self.caches.create.assert_called_once()
+
+    def test_ignores_malformed_cache_file(self):
+        with open(self.cache_file, "w") as f:
+            f.write("[]")
+        self.assertEqual(self.get_or_create(), "cachedContents/1")
+        self.caches.create.assert_called_once()
+
+    def test_retries_other_client_errors(self):
+        self.caches.create.side_effect = errors.ClientError(
+            400, {"error": {"code": 400, "message": "API key not valid."}}
+        )
+        self.assertIsNone(self.get_or_create())
+        self.assertIsNone(self.get_or_create())
+        self.assertEqual(self.caches.create.call_count, 2)
+
+
+class TestSemanticCache(unittest.TestCase):
+    EMBEDDINGS = {"add 2 and 3": [1.0, 0.0], "add 3 and 2": [0.99, 0.1], "list files": [0.0, 1.0]}
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = os.path.join(tmp_dir.name, "cache.sqlite3")
+        self.client = mock.Mock()
+        self.client.aio.models.embed_content = mock.AsyncMock(side_effect=self.embed)
+
+    async def embed(self, model, contents):
+        values = self.EMBEDDINGS[contents]
+        return types.EmbedContentResponse(embeddings=[types.ContentEmbedding(values=values)])
+
+    def test_similar_prompt_hits(self):
+        cache = SemanticCache(self.client, path=self.path)
+        asyncio.run(cache.insert("add 2 and 3", "5"))
+        self.assertEqual(asyncio.run(cache.lookup("add 3 and 2")), "5")
+
+    def test_dissimilar_prompt_misses(self):
+        cache = SemanticCache(self.client, path=self.path)
+        asyncio.run(cache.insert("add 2 and 3", "5"))
+        self.assertIsNone(asyncio.run(cache.lookup("list files")))
+
+    def test_entries_are_persisted(self):
+        asyncio.run(SemanticCache(self.client, path=self.path).insert("add 2 and 3", "5"))
+        cache = SemanticCache(self.client, path=self.path)
+        self.assertEqual(asyncio.run(cache.lookup("add 2 and 3")), "5")
+
+    def test_other_context_misses(self):
+        asyncio.run(SemanticCache(self.client, path=self.path, context="a").insert("add 2 and 3", "5"))
+        cache = SemanticCache(self.client, path=self.path, context="b")
+        self.assertIsNone(asyncio.run(cache.lookup("add 2 and 3")))
+
+    def test_database_failure_is_not_raised(self):
+        cache = SemanticCache(self.client, path=self.path)
+        cache._db.close()
+        asyncio.run(cache.insert("add 2 and 3", "5"))
+        self.assertIsNone(asyncio.run(cache.lookup("add 2 and 3")))
+
+    def test_unreadable_database_falls_back_to_memory(self):
+        with open(self.path, "wb") as f:
+            f.write(b"not a database" * 100)
+        cache = SemanticCache(self.client, path=self.path)
+        asyncio.run(cache.insert("add 2 and 3", "5"))
+        self.assertEqual(asyncio.run(cache.lookup("add 3 and 2")), "5")
+
+    def test_unopenable_database_falls_back_to_memory(self):
+        cache = SemanticCache(self.client, path=os.path.join(self.path, "missing", "cache.sqlite3"))
+        asyncio.run(cache.insert("add 2 and 3", "5"))
+        self.assertEqual(asyncio.run(cache.lookup("add 2 and 3")), "5")
+
+    def test_empty_embedding_is_a_miss(self):
+        self.client.aio.models.embed_content.side_effect = None
+        self.client.aio.models.embed_content.return_value = types.EmbedContentResponse(
+            embeddings=[types.ContentEmbedding()]
+        )
+        cache = SemanticCache(self.client, path=self.path)
+        self.assertIsNone(asyncio.run(cache.lookup("add 2 and 3")))
+
+    def test_embedding_failure_is_a_miss(self):
+        self.client.aio.models.embed_content.side_effect = errors.ServerError(503, {})
+        cache = SemanticCache(self.client, path=self.path)
+        self.assertIsNone(asyncio.run(cache.lookup("add 2 and 3")))
+
+
+class TestParseArgs(unittest.TestCase):
+    def test_verbose_between_prompt_words(self):
+        args = parse_args(["fix", "--verbose", "the calculator"])
+        self.assertEqual(args.prompt, ["fix", "the calculator"])
+        self.assertTrue(args.verbose)
+
+    def test_verbose_defaults_to_false(self):
+        self.assertFalse(parse_args(["hello"]).verbose)
+
+    def test_missing_prompt_exits(self):
+        with mock.patch("sys.stderr"), self.assertRaises(SystemExit) as cm:
+            parse_args(["--verbose"])
+        self.assertEqual(cm.exception.code, 2)
+
+    def test_prompts_file_replaces_prompt(self):
+        args = parse_args(["--prompts-file", "prompts.txt", "--concurrency", "2"])
+        self.assertEqual(args.prompts_file, "prompts.txt")
+        self.assertEqual(args.concurrency, 2)
+
+    def test_prompt_and_prompts_file_exits(self):
+        with mock.patch("sys.stderr"), self.assertRaises(SystemExit) as cm:
+            parse_args(["hello", "--prompts-file", "prompts.txt"])
+        self.assertEqual(cm.exception.code, 2)
+
+
+class TestMain(unittest.TestCase):
+    def test_flags_are_not_sent_as_prompt(self):
+        argv = ["main.py", "fix", "--verbose", "the calculator", "--no-cache"]
+        with mock.patch("sys.argv", argv), mock.patch.object(main, "_get_client"), mock.patch.object(
+            main, "run_agent", return_value="done"
+        ) as run_agent, mock.patch("builtins.print"):
+            asyncio.run(main.main())
+        run_agent.assert_called_once_with(mock.ANY, "fix the calculator", True, cache=None)
+
+
+class TestRunAgent(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        for patcher in (
+            mock.patch("call_function.WORKING_DIR", tmp_dir.name),
+            mock.patch.object(main, "_get_config", new=mock.AsyncMock(return_value=types.GenerateContentConfig())),
+            mock.patch("builtins.print"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.turns = []
+        self.requests = []
+        models = mock.Mock()
+        models.generate_content_stream = self.generate_content_stream
+        self.client = mock.Mock()
+        self.client.aio.chats.create.side_effect = lambda model, config, history=(): chats.AsyncChat(
+            modules=models, model=model, config=config, history=list(history)
+        )
+        self.cache = mock.Mock()
+        self.cache.lookup = mock.AsyncMock(return_value=None)
+        self.cache.insert = mock.AsyncMock()
+
+    async def generate_content_stream(self, model, contents, config):
+        self.requests.append(list(contents))
+
+        async def stream(parts):
+            for i, part in enumerate(parts, 1):
+                # The chat session only records the turn once a chunk finishes it
+                finish_reason = types.FinishReason.STOP if i == len(parts) else None
+                yield types.GenerateContentResponse(
+                    candidates=[
+                        types.Candidate(
+                            content=types.Content(role="model", parts=[part]),
+                            finish_reason=finish_reason,
+                        )
+                    ]
+                )
+
+        return stream(self.turns.pop(0))
+
+    def run_agent(self):
+        return asyncio.run(main.run_agent(self.client, "list files", False, cache=self.cache))
+
+    def test_plain_answer_is_cached(self):
+        self.turns = [[types.Part(text="Nothing "), types.Part(text="to do.")]]
+        self.assertEqual(self.run_agent(), "Nothing to do.")
+        self.cache.insert.assert_awaited_once_with("list files", "Nothing to do.")
+
+    def test_answer_after_function_call_is_not_cached(self):
+        function_call = types.Part(function_call=types.FunctionCall(name="get_files_info", args={}))
+        self.turns = [
+            [types.Part(text="Let me "), types.Part(text="look."), function_call],
+            [types.Part(text="It is empty.")],
+        ]
+        self.assertEqual(self.run_agent(), "It is empty.")
+        self.cache.insert.assert_not_awaited()
+        history = self.requests[1]
+        self.assertEqual([content.role for content in history], ["user", "model", "user"])
+        self.assertEqual(history[1].parts, [types.Part(text="Let me look."), function_call])
+        self.assertEqual(history[2].parts[0].function_response.name, "get_files_info")
+
+    def test_cache_hit_skips_the_model(self):
+        self.cache.lookup.return_value = "cached"
+        self.assertEqual(self.run_agent(), "cached")
+        self.client.aio.chats.create.assert_not_called()
+
+
+class TestRunPromptsFile(unittest.TestCase):
+    def run_prompts(self, prompts, concurrency):
+        running = 0
+        self.max_running = 0
+
+        async def run_agent(client, user_prompt, verbose, echo=True, cache=None, label=""):
+            nonlocal running
+            running += 1
+            self.max_running = max(self.max_running, running)
+            # Later prompts finish first
+            await asyncio.sleep(0.01 * (len(prompts) - prompts.index(user_prompt)))
+            running -= 1
+            if user_prompt == "fail":
+                raise RuntimeError("boom")
+            return f"answer to {user_prompt}"
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            prompts_file = os.path.join(tmp_dir, "prompts.txt")
+            with open(prompts_file, "w") as f:
+                f.write("\n".join(prompts) + "\n\n")
+            with mock.patch.object(main, "run_agent", run_agent), mock.patch(
+                "builtins.print"
+            ) as print_mock:
+                asyncio.run(main.run_prompts_file(mock.Mock(), prompts_file, concurrency, False))
+        return [call.args[0] for call in print_mock.call_args_list]
+
+    def test_responses_follow_file_order(self):
+        output = self.run_prompts(["one", "two", "three"], concurrency=3)
+        self.assertEqual(
+            output,
+            [
+                "[1] User prompt: one",
+                "answer to one\n",
+                "[2] User prompt: two",
+                "answer to two\n",
+                "[3] User prompt: three",
+                "answer to three\n",
+            ],
+        )
+
+    def test_concurrency_is_limited(self):
+        self.run_prompts([str(number) for number in range(6)], concurrency=2)
+        self.assertEqual(self.max_running, 2)
+
+    def test_failed_prompt_is_reported_alone(self):
+        output = self.run_prompts(["one", "fail", "three"], concurrency=3)
+        self.assertEqual(output[2:4], ["[2] User prompt: fail", "Error: boom\n"])
+        self.assertEqual(output[5], "answer to three\n")
+
+
+class TestGetConfig(unittest.TestCase):
+    def setUp(self):
+        main._get_config.cache_clear()
+        self.addCleanup(main._get_config.cache_clear)
+        self.client = mock.Mock()
+
+    def get_configs(self, count):
+        async def get_configs():
+            return await asyncio.gather(*(main._get_config(self.client) for _ in range(count)))
+
+        return asyncio.run(get_configs())
+
+    def test_config_is_built_once(self):
+        with mock.patch("context_cache.get_or_create_cache", return_value=None) as cache:
+            config, other = self.get_configs(2)
+        self.assertIs(other, config)
+        cache.assert_awaited_once()
+        self.assertIs(cache.call_args.args[0], self.client)
+        self.assertEqual(len(config.tools[0].function_declarations), 4)
+
+    def test_config_references_context_cache(self):
+        with mock.patch("context_cache.get_or_create_cache", return_value="cachedContents/1"):
+            (config,) = self.get_configs(1)
+        self.assertEqual(config.cached_content, "cachedContents/1")
+        self.assertIsNone(config.tools)
+
+    def test_cache_failure_falls_back_to_inline_config(self):
+        with mock.patch("context_cache.get_or_create_cache", side_effect=AttributeError("boom")):
+            (config,) = self.get_configs(1)
+        self.assertIsNone(config.cached_content)
+        self.assertEqual(config.system_instruction, main.system_prompt)
+
+
+class TestLoadEnv(unittest.TestCase):
+    def test_exported_key_skips_dotenv(self):
+        with mock.patch.dict(os.environ, {"GEMINI_API_KEY": "exported"}), mock.patch(
+            "dotenv.load_dotenv"
+        ) as load_dotenv:
+            self.assertEqual(main._load_env(), "exported")
+        load_dotenv.assert_not_called()
+
+    def test_missing_key_reads_dotenv(self):
+        with mock.patch.dict(os.environ), mock.patch("dotenv.load_dotenv") as load_dotenv:
+            os.environ.pop("GEMINI_API_KEY", None)
+            main._load_env()
+        load_dotenv.assert_called_once()
+
+
+class TestCoalesceModelTurn(unittest.TestCase):
+    def test_streamed_chunks_become_one_turn(self):
+        function_call = types.Part(function_call=types.FunctionCall(name="get_files_info", args={}))
+        history = [
+            types.Content(role="user", parts=[types.Part(text="hi")]),
+            types.Content(role="model", parts=[types.Part(text="Let me ")]),
+            types.Content(role="model", parts=[types.Part(text="look.")]),
+            types.Content(role="model", parts=[function_call]),
+        ]
+        merged = main._coalesce_model_turn(history)
+        self.assertEqual([content.role for content in merged], ["user", "model"])
+        self.assertEqual(merged[1].parts, [types.Part(text="Let me look."), function_call])
+        self.assertEqual(len(history), 4)
 
 
 if __name__ == "__main__":
-    test()
+    unittest.main()